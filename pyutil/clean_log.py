@@ -2,15 +2,26 @@ import re
 import sys
 
 request_re = re.compile(r'"(HEAD|GET|POST) ([^ ]+) HTTP/1.\d"')
+WRITE_BATCH = 8192
 
-with open(sys.argv[1] + "_cleaned", "w") as out:
+with open(sys.argv[1] + "_cleaned", "w", buffering=1 << 20) as out:
     with open(sys.argv[1], "r") as log:
+        search = request_re.search
+        batch = []
+        batch_append = batch.append
+        writelines = out.writelines
         for line in log:
-            s = request_re.search(line)
+            s = search(line)
             if s:
-                if s.group(1) == "POST":
+                method, path = s.groups()
+                if method == "POST":
                     continue
                 else:
-                    out.write(s.group(2) + "\n")
+                    batch_append(path)
+                    batch_append("\n")
+                    if len(batch) >= WRITE_BATCH:
+                        writelines(batch)
+                        batch.clear()
             else:
                 print(line)
+        writelines(batch)
@@ -1,29 +1,63 @@
+import asyncio
+import functools
 import io
 import re
 from math import ceil
 from urllib.parse import quote
 
 import httpx
+import numpy as np
 from PIL import Image, UnidentifiedImageError
 
 SPRITE_SIZE = 48
 ATLAS_ROW_LENGTH = 16
 CSS = "#%s {\n  background-position: %dpx %dpx\n}\n\n"
 UNKNOWN_IMAGE_URL = "http://localhost:3000/v1/follower/Coloured%2FDeer?animation=shrug&format=png&start_time=.6"
+CONCURRENCY = 16
 
+_SLUG_NONALNUM = re.compile(r"[^A-Za-z0-9]")
+_SLUG_CAMEL = re.compile(r"([a-z])([A-Z])")
+_SLUG_SUB1 = _SLUG_NONALNUM.sub
+_SLUG_SUB2 = _SLUG_CAMEL.sub
 
+
+@functools.lru_cache(maxsize=None)
 def slugify(s):
-    s = re.sub(r"[^A-Za-z0-9]", "-", s)
-    s = re.sub(r"([a-z])([A-Z])", "\\1-\\2", s)
-    return s.lower()
+    return _SLUG_SUB2("\\1-\\2", _SLUG_SUB1("-", s)).lower()
+
+
+async def fetch_all(urls):
+    # Fetch every URL concurrently over a shared keep-alive client, returning bodies in the same order
+    limits = httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        sem = asyncio.Semaphore(CONCURRENCY)
+
+        async def one(url):
+            async with sem:
+                resp = await client.get(url)
+                resp.raise_for_status()
+                return resp.content
+
+        return await asyncio.gather(*(one(url) for url in urls))
+
+
+def paste(canvas, im, x, y):
+    # Straight copy into an RGBA canvas array, clipped to the canvas like Image.paste
+    arr = np.asarray(im.convert("RGBA"))
+    h = min(arr.shape[0], canvas.shape[0] - y)
+    w = min(arr.shape[1], canvas.shape[1] - x)
+    canvas[y:y + h, x:x + w] = arr[:h, :w]
 
 
 def make_spritesheet(items, url, filename, css_prefix=""):
+    # Fetch everything before allocating the sheet, so a failed request doesn't leave us holding it
+    bodies = asyncio.run(fetch_all([url % quote(item["name"], safe='') for item in items]))
+
     row_count = int(ceil(len(items) / ATLAS_ROW_LENGTH))
     image_width = 4 + (SPRITE_SIZE + 2) * ATLAS_ROW_LENGTH
     image_height = 4 + (SPRITE_SIZE + 2) * row_count
 
-    image = Image.new("RGBA", (image_width, image_height))
+    image = np.zeros((image_height, image_width, 4), dtype=np.uint8)
     x = 2
     y = 2
     this_row = 0
@@ -31,14 +65,12 @@ def make_spritesheet(items, url, filename, css_prefix=""):
 
     css.write('.%s { background: url("%s.png"); }\n\n' % (filename, filename))
 
-    for i, item in enumerate(items):
+    for i, (item, body) in enumerate(zip(items, bodies)):
         slug = slugify(item["name"])
         print(f"#{i}", item["name"], slug, f"({x}, {y})")
-        resp = httpx.get(url % quote(item["name"], safe=''))
-        resp.raise_for_status()
 
         try:
-            im = Image.open(io.BytesIO(resp.content))
+            im = Image.open(io.BytesIO(body))
         except UnidentifiedImageError:
             resp = httpx.get(UNKNOWN_IMAGE_URL)
             resp.raise_for_status()
@@ -47,7 +79,7 @@ def make_spritesheet(items, url, filename, css_prefix=""):
         im.thumbnail((SPRITE_SIZE, SPRITE_SIZE))
         assert x + SPRITE_SIZE < image_width
         assert y + SPRITE_SIZE < image_height
-        image.paste(im, (x, y))
+        paste(image, im, x, y)
         css.write(CSS % (css_prefix + slug, -x, -y))
         this_row += 1
         if this_row == ATLAS_ROW_LENGTH:
@@ -57,116 +89,121 @@ def make_spritesheet(items, url, filename, css_prefix=""):
         else:
             x += SPRITE_SIZE + 2
 
-    image.save(f"{filename}.png")
+    Image.fromarray(image).save(f"{filename}.png")
+
+
+def skin_url(skin, animation):
+    return str(httpx.URL(f"http://localhost:3000/v1/{SPRITE}/{quote(skin, safe='')}",
+                         params={"animation": animation, "format": "png"}))
+
+
+def animation_frames_url(skin, animation, fps, duration, format="apng"):
+    return str(httpx.URL(f"http://localhost:3000/v1/{SPRITE}/{quote(skin, safe='')}",
+                         params={"animation": animation, "format": format, "end_time": str(duration), "fps": str(fps), "scale": "0.5"}))
 
 
 def skins(data, animation="walk"):
+    bodies = asyncio.run(fetch_all([skin_url(skin["name"], animation) for skin in data["skins"]]))
+
     skin_count = len(data["skins"])
     row_count = int(ceil(skin_count / ATLAS_ROW_LENGTH))
     image_width = 4 + (SPRITE_SIZE + 2) * ATLAS_ROW_LENGTH
     image_height = 4 + (SPRITE_SIZE + 2) * row_count
 
-    image = Image.new("RGBA", (image_width, image_height))
+    image = np.zeros((image_height, image_width, 4), dtype=np.uint8)
     x = 2
     y = 2
     css = open(f"{SPRITE}-animations.css", "w")
 
-    for skin in data["skins"]:
+    for skin, body in zip(data["skins"], bodies):
         slug = slugify(skin["name"])
         print(skin["name"], slug)
-        resp = httpx.get(f"http://localhost:3000/v1/{SPRITE}/{quote(skin['name'], safe='')}",
-                         params={"animation": animation, "format": "png"})
-        resp.raise_for_status()
         try:
-            im = Image.open(io.BytesIO(resp.content))
+            im = Image.open(io.BytesIO(body))
         except UnidentifiedImageError:
             continue
         im.thumbnail((SPRITE_SIZE, SPRITE_SIZE))
-        image.paste(im, (pos, 2))
+        paste(image, im, pos, 2)
         css.write(CSS % (slug, -pos, -2))
         pos += SPRITE_SIZE + 2
 
-    image.save(f"{SPRITE}-skins.png")
+    Image.fromarray(image).save(f"{SPRITE}-skins.png")
 
 
 def skins_dumb(data, animation="walk"):
-    for skin in data["skins"]:
+    bodies = asyncio.run(fetch_all([skin_url(skin["name"], animation) for skin in data["skins"]]))
+
+    for skin, body in zip(data["skins"], bodies):
         slug = slugify(skin["name"])
         print(skin["name"], slug)
-        resp = httpx.get(f"http://localhost:3000/v1/{SPRITE}/{quote(skin['name'], safe='')}",
-                         params={"animation": animation, "format": "png"})
-        resp.raise_for_status()
         with open(f"{SPRITE}/skins/{slug}.png", "wb") as f:
-            f.write(resp.content)
+            f.write(body)
 
 
 def animations(data, skin="Coloured/Fox", fps=6, duration=1):
+    bodies = asyncio.run(fetch_all([animation_frames_url(skin, animation["name"], fps, duration) for animation in data["animations"]]))
+
     pos = 2
     css = open(f"{SPRITE}-animations.css", "w")
 
-    frames = [Image.new("RGBA", (4 + len(data["animations"]) * (SPRITE_SIZE + 2), SPRITE_SIZE + 4)) for _ in range(round(fps * duration))]
+    frames = np.zeros((round(fps * duration), SPRITE_SIZE + 4, 4 + len(data["animations"]) * (SPRITE_SIZE + 2), 4), dtype=np.uint8)
 
-    for animation in data["animations"]:
+    for animation, body in zip(data["animations"], bodies):
         slug = slugify(animation["name"])
         print(animation["name"], slug)
-        resp = httpx.get(f"http://localhost:3000/v1/{SPRITE}/{quote(skin, safe='')}",
-                         params={"animation": animation["name"], "format": "apng", "end_time": str(duration), "fps": str(fps), "scale": "0.5"})
-        resp.raise_for_status()
 
         try:
-            im = Image.open(io.BytesIO(resp.content))
+            im = Image.open(io.BytesIO(body))
         except UnidentifiedImageError:
             continue
 
         for i, frame in enumerate(frames):
             im.seek(i % im.n_frames)
-            frame.paste(im, (pos, 2))
+            paste(frame, im, pos, 2)
 
         css.write(CSS % (slug, -pos, -2))
         pos += SPRITE_SIZE + 2
 
     for i, frame in enumerate(frames):
-        frame.save(f"{SPRITE}-animations.{i}.png")
+        Image.fromarray(frame).save(f"{SPRITE}-animations.{i}.png")
 
 
 def animations_plain(data, skin="Coloured/Fox", timestamp=0.25):
+    bodies = asyncio.run(fetch_all([animation_frames_url(skin, animation["name"], fps, duration) for animation in data["animations"]]))
+
     pos = 2
     css = open(f"{SPRITE}-animations.css", "w")
 
-    frames = [Image.new("RGBA", (4 + len(data["animations"]) * (SPRITE_SIZE + 2), SPRITE_SIZE + 4)) for _ in range(round(fps * duration))]
+    frames = np.zeros((round(fps * duration), SPRITE_SIZE + 4, 4 + len(data["animations"]) * (SPRITE_SIZE + 2), 4), dtype=np.uint8)
 
-    for animation in data["animations"]:
+    for animation, body in zip(data["animations"], bodies):
         slug = slugify(animation["name"])
         print(animation["name"], slug)
-        resp = httpx.get(f"http://localhost:3000/v1/{SPRITE}/{quote(skin, safe='')}",
-                         params={"animation": animation["name"], "format": "apng", "end_time": str(duration), "fps": str(fps), "scale": "0.5"})
-        resp.raise_for_status()
 
         try:
-            im = Image.open(io.BytesIO(resp.content))
+            im = Image.open(io.BytesIO(body))
         except UnidentifiedImageError:
             continue
 
         for i, frame in enumerate(frames):
             im.seek(i % im.n_frames)
-            frame.paste(im, (pos, 2))
+            paste(frame, im, pos, 2)
 
         css.write(CSS % (slug, -pos, -2))
         pos += SPRITE_SIZE + 2
 
     for i, frame in enumerate(frames):
-        frame.save(f"{SPRITE}-animations.{i}.png")
+        Image.fromarray(frame).save(f"{SPRITE}-animations.{i}.png")
 
 
 def animations_dumb(data, skin="Coloured/Fox", fps=6, duration=1):
-    for animation in data["animations"]:
+    bodies = asyncio.run(fetch_all([animation_frames_url(skin, animation["name"], fps, duration, format="gif") for animation in data["animations"]]))
+
+    for animation, body in zip(data["animations"], bodies):
         slug = slugify(animation["name"])
         print(animation["name"], slug)
-        resp = httpx.get(f"http://localhost:3000/v1/{SPRITE}/{quote(skin, safe='')}",
-                         params={"animation": animation["name"], "format": "gif", "end_time": str(duration), "fps": str(fps), "scale": "0.5"})
-        resp.raise_for_status()
         with open(f"{SPRITE}/animations/{slug}.gif", "wb") as f:
-            f.write(resp.content)
+            f.write(body)
 
 actor_list = httpx.get("http://localhost:3000/v1").json()["actors"]
 
@@ -1,66 +1,136 @@
 import glob
+import io
 import json
 import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 import UnityPy
 
 PATH = "/Users/mark/Library/Application Support/Steam/steamapps/common/Cult of the Lamb/Cult Of The Lamb.app/Contents/Resources/Data"
 
 
-texture2d_locations = {}
+# Serialized files and bundles; everything else in Data (.resS streams, configs, icons) has no objects to find
+UNITY_EXTENSIONS = {"assets", "bundle", "unity3d"}
 
 
-if 1:
-    print("Extracting TextAssets")
-    for root, dirs, files in os.walk(PATH):
-        for filename in files:
-            path = os.path.join(root, filename)
-            env = UnityPy.load(path)
+def is_unity_file(filename):
+    # Extensionless files are levelN/globalgamemanagers and the like
+    if "." not in filename:
+        return True
+    return filename.rsplit(".", 1)[1].lower() in UNITY_EXTENSIONS
 
-            for obj in env.objects:
-                if obj.type.name == "TextAsset":
-                    data = obj.read()
-                    dest = f"extracted/{data.name}"
-                    print(dest)
-                    with open(dest, "wb") as out:
-                        out.write(data.m_Script)
-                elif obj.type.name == "Texture2D":
-                    data = obj.read()
-                    texture2d_locations[data.name] = path
 
+def atlas_textures():
+    # The first non-empty line of a Spine atlas is the name of its texture
+    textures = set()
+    add_texture = textures.add
+    for atlas in glob.glob("extracted/*.atlas"):
+        for line in open(atlas, "rt"):
+            line = line.strip()
+            if line:
+                add_texture(line.replace(".png", ""))
+                break
+    return textures
 
-    with open("texture2d_locations.json", "w") as j:
-        json.dump(texture2d_locations, j)
-else:
-    with open("texture2d_locations.json") as j:
-        texture2d_locations = json.load(j)
 
+def encode_png(data):
+    png = io.BytesIO()
+    data.image.save(png, format="PNG")
+    return png.getvalue()
 
-print("Finding wanted textures")
-wanted_textures = set()
-files_to_read = set()
 
-for atlas in glob.glob("extracted/*.atlas"):
-    for line in open(atlas, "rt"):
-        line = line.strip()
-        if line:
-            texture_name = line.replace(".png", "")
-            print(texture_name)
-            wanted_textures.add(texture_name)
-            try:
-                files_to_read.add(texture2d_locations[texture_name])
-            except KeyError:
-                print(f"!!! No texture found for {texture_name}!")
-            break
+def scan(path, wanted_textures=frozenset()):
+    # Collect TextAssets and record where each Texture2D lives, encoding any texture we already know we want
+    # so the file doesn't need to be loaded a second time. Nothing is written here: names can repeat across
+    # files, so the parent writes everything in walk order and the last file wins, as texture2d_locations does
+    env = UnityPy.load(path)
+    text_assets = []
+    texture2d_locations = {}
+    textures = []
+
+    for obj in env.objects:
+        if obj.type.name == "TextAsset":
+            data = obj.read()
+            text_assets.append((data.name, data.m_Script))
+        elif obj.type.name == "Texture2D":
+            data = obj.read()
+            texture2d_locations[data.name] = path
+            if data.name in wanted_textures:
+                textures.append((data.name, encode_png(data)))
 
+    return text_assets, texture2d_locations, textures
 
-print(f"Extracting Texture2Ds from {len(files_to_read)} files")
-for file_to_read in files_to_read:
-    env = UnityPy.load(file_to_read)
+
+def extract_textures(path, texture_names):
+    # Only the textures whose recorded location is this file, so each name comes from exactly one place
+    env = UnityPy.load(path)
+    textures = []
 
     for obj in env.objects:
         if obj.type.name == "Texture2D":
             data = obj.read()
-            if data.name in wanted_textures:
-                dest = f"extracted/{data.name}.png"
-                data.image.save(dest)
+            if data.name in texture_names:
+                textures.append((data.name, encode_png(data)))
+
+    return textures
+
+
+def write_textures(textures):
+    for name, png in textures:
+        with open(f"extracted/{name}.png", "wb") as out:
+            out.write(png)
+
+
+def main():
+    texture2d_locations = {}
+    saved_textures = set()
+
+    # Atlases left over from a previous run tell us which textures to save during the scan
+    wanted_textures = atlas_textures()
+
+    if 1:
+        print("Extracting TextAssets")
+        paths = [os.path.join(root, filename) for root, dirs, files in os.walk(PATH) for filename in files
+                 if is_unity_file(filename)]
+
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            for text_assets, locations, textures in executor.map(partial(scan, wanted_textures=frozenset(wanted_textures)), paths, chunksize=16):
+                for name, script in text_assets:
+                    dest = f"extracted/{name}"
+                    print(dest)
+                    with open(dest, "wb") as out:
+                        out.write(script)
+                texture2d_locations.update(locations)
+                write_textures(textures)
+                saved_textures.update(name for name, _ in textures)
+
+        with open("texture2d_locations.json", "w") as j:
+            json.dump(texture2d_locations, j)
+    else:
+        with open("texture2d_locations.json") as j:
+            texture2d_locations = json.load(j)
+
+    print("Finding wanted textures")
+    wanted_textures = atlas_textures()
+    files_to_read = {}
+    locations_get = texture2d_locations.get
+
+    for texture_name in sorted(wanted_textures):
+        print(texture_name)
+        if texture_name in saved_textures:
+            continue
+        location = locations_get(texture_name)
+        if location is None:
+            print(f"!!! No texture found for {texture_name}!")
+        else:
+            files_to_read.setdefault(location, set()).add(texture_name)
+
+    print(f"Extracting Texture2Ds from {len(files_to_read)} files")
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        for textures in executor.map(extract_textures, files_to_read.keys(), files_to_read.values()):
+            write_textures(textures)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import itertools
 import queue
 import threading
 import time
@@ -9,6 +10,7 @@ HOST = "localhost:3000"
 THREADS = 8
 REQUESTS = 100000
 WINDOW = 5.0
+BATCH_SIZE = 128
 
 
 class Requester(threading.Thread):
@@ -16,16 +18,21 @@ class Requester(threading.Thread):
         super().__init__()
         self.queue = queue
         self.out_queue = out_queue
+        # One long-lived client per thread, so each worker keeps a warm keep-alive connection
+        self.client = httpx.Client(timeout=30,
+                                   limits=httpx.Limits(max_connections=1, max_keepalive_connections=1))
 
     def run(self):
         while True:
-            url = self.queue.get()
-            if url is None:
+            urls = self.queue.get()
+            if urls is None:
+                self.client.close()
                 self.out_queue.put(None)
                 return
-            resp = httpx.get(f"http://{HOST}{url}", timeout=30)
-            body_len = len(resp.read())
-            self.out_queue.put((time.time(), resp.status_code, body_len))
+            for url in urls:
+                resp = self.client.get(f"http://{HOST}{url}")
+                body_len = len(resp.read())
+                self.out_queue.put((time.time(), resp.status_code, body_len))
 
 
 def make_thread_pool(thread_count):
@@ -38,13 +45,12 @@ def make_thread_pool(thread_count):
 
 
 def fill_url_queue(url_queue, request_count, log_name="cotl.xl0.org.log.cleaned"):
-    requests_so_far = 0
-    for line in open(log_name):
-        url_queue.put(line.strip())
-        requests_so_far += 1
-
-        if requests_so_far == request_count:
-            break
+    # Hand out URLs in batches so workers take the queue lock once per BATCH_SIZE requests
+    with open(log_name) as log:
+        # Stop reading at request_count; strip() drops the newline and any stray whitespace
+        urls = [line.strip() for line in itertools.islice(log, request_count)]
+    for i in range(0, len(urls), BATCH_SIZE):
+        url_queue.put(urls[i:i + BATCH_SIZE])
 
 
 def main():
@@ -55,6 +61,7 @@ def main():
         url_queue.put(None)
 
     resps = deque()
+    total_size = 0
     done = 0
     while done < THREADS:
         try:
@@ -66,14 +73,12 @@ def main():
                 done += 1
             else:
                 resps.append(q)
+                total_size += q[2]
 
         oldest = time.time() - WINDOW
         while resps and resps[0][0] < oldest:
-            resps.popleft()
-
-        total_size = 0
-        for _, status, size in resps:
-            total_size += size
+            _, _, size = resps.popleft()
+            total_size -= size
 
         print(f"{len(resps)} req, {total_size/1024.0/1024.0} MB in {WINDOW:.2f} sec")
 
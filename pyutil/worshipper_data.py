@@ -1,134 +1,199 @@
+import mmap
 import os
 import struct
 import json
-
-
-class WorshipperData:
-    def __init__(self, filename):
-        self.f = open(filename, "rb")
-        self.f.seek(0, os.SEEK_END)
-        self.length = self.f.tell()
-        self.f.seek(0, os.SEEK_SET)
-
-    def at_eof(self):
-        return self.f.tell() == self.length
-
-    def read_u32(self):
-        return struct.unpack("<L", self.f.read(4))[0]
-
-    def read_f32(self):
-        return struct.unpack("<f", self.f.read(4))[0]
-
-    def read_string(self):
-        length = self.read_u32()
-        s = self.f.read(length)
-        if length % 4 != 0:
-            padding = self.f.read(4 - (length % 4))
-            for p in padding:
-                if p != 0:
-                    raise ValueError("String {} padded with {:r}", s, padding)
-        return s.decode("utf-8")
-
-    def read_set(self):
-        colors = {}
-        slot_count = self.read_u32()
-        for _ in range(slot_count):
-            slot = self.read_string()
-            r = self.read_f32()
-            g = self.read_f32()
-            b = self.read_f32()
-            a = self.read_f32()
-            colors[slot] = {
-                "r": r,
-                "g": g,
-                "b": b,
-                "a": a,
-            }
-        colors["last"] = self.read_f32(), self.read_f32(), self.read_f32(), self.read_f32()
-        return colors
-
-    def read_skin(self):
-        name = self.read_string()
-        zone = self.read_u32()
-        is_blocked = self.read_u32()
-        is_toww = self.read_u32()
-        is_boss = self.read_u32()
-
-        skins = []
-        skin_count = self.read_u32()
-        for i in range(skin_count):
-            skins.append(self.read_string())
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import UnityPy
+
+from extract import is_unity_file
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_U32 = struct.Struct("<L")
+_4U32 = struct.Struct("<LLLL")
+_4F32 = struct.Struct("<ffff")
+
+
+def read_string(mv, off, u32=_U32.unpack_from):
+    length = u32(mv, off)[0]
+    off += 4
+    s = mv[off:off + length].tobytes()
+    off += length
+    if length % 4 != 0:
+        padding_end = off + 4 - (length % 4)
+        if any(mv[off:padding_end]):
+            raise ValueError("String {!r} padded with {!r}".format(s, mv[off:padding_end].tobytes()))
+        off = padding_end
+    return s.decode("utf-8"), off
+
+
+def read_set(mv, off, u32=_U32.unpack_from, rgba=_4F32.unpack_from):
+    colors = {}
+    slot_count = u32(mv, off)[0]
+    off += 4
+    for _ in range(slot_count):
+        slot, off = read_string(mv, off)
+        r, g, b, a = rgba(mv, off)
+        off += 16
+        colors[slot] = {
+            "r": r,
+            "g": g,
+            "b": b,
+            "a": a,
+        }
+    colors["last"] = rgba(mv, off)
+    return colors, off + 16
+
+
+def parse_file(mv):
+    # The whole file is walked with a single offset cursor held in a local, so each field is one
+    # unpack_from call with no attribute lookups on the way
+    u32 = _U32.unpack_from
+    skin_header = _4U32.unpack_from
+    length = len(mv)
+
+    off = 44    # 11 unknown u32s
+
+    initial_sets = []
+    set_count = u32(mv, off)[0]
+    off += 4
+    for _ in range(set_count):
+        colors, off = read_set(mv, off)
+        initial_sets.append(colors)
+    off += 4    # last
+
+    skins = []
+    while off != length:
+        name, off = read_string(mv, off)
+        zone, is_blocked, is_toww, is_boss = skin_header(mv, off)
+        off += 16
+
+        skin_names = []
+        skin_count = u32(mv, off)[0]
+        off += 4
+        for _ in range(skin_count):
+            skin_name, off = read_string(mv, off)
+            skin_names.append(skin_name)
 
         sets = []
-        set_count = w.read_u32()
-        for s in range(set_count):
-            sets.append(self.read_set())
+        set_count = u32(mv, off)[0]
+        off += 4
+        for _ in range(set_count):
+            colors, off = read_set(mv, off)
+            sets.append(colors)
 
-        last = self.read_u32()
-        return {
+        last = u32(mv, off)[0]
+        off += 4
+
+        skins.append({
             "name": name,
             "zone": zone,
             "is_blocked": is_blocked,
             "is_toww": is_toww,
             "is_boss": is_boss,
-            "skins": skins,
+            "skins": skin_names,
             "sets": sets,
             "last": last
-        }
+        })
+
+    return initial_sets, skins
 
 
-if 1:
-    import UnityPy
-    PATH = "/Users/mark/Library/Application Support/Steam/steamapps/common/Cult of the Lamb/Cult Of The Lamb.app/Contents/Resources/Data"
+def read_file(filename):
+    with open(filename, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            mv = memoryview(mm)
+            try:
+                return parse_file(mv)
+            finally:
+                mv.release()
 
-    print("Finding Worshipper Data")
 
-    class Done(Exception):
-        pass
+def find_worshipper_data(path):
+    env = UnityPy.load(path)
 
+    for obj in env.objects:
+        if obj.type.name == "GameObject":
+            data = obj.read()
+            if data.name == "Worshipper Data":
+                for component in data.m_Components:
+                    if component.type == 114:   # <ClassIDType.MonoBehaviour: 114>
+                        return component.get_raw_data()
+
+    return None
+
+
+def scan_for_worshipper_data(root_path):
+    paths = [os.path.join(root, filename) for root, dirs, files in os.walk(root_path) for filename in files
+             if is_unity_file(filename)]
+
+    # Like the serial walk, the first hit in walk order wins: once a file matches, later files are cancelled
+    # but earlier ones still get to finish. A file that fails to load is reported and skipped
+    found_index = None
+    worshipper_data = None
+    errors = []
+
+    executor = ProcessPoolExecutor(max_workers=os.cpu_count())
     try:
-        for root, dirs, files in os.walk(PATH):
-            for filename in files:
-                path = os.path.join(root, filename)
-                env = UnityPy.load(path)
-
-                for obj in env.objects:
-                    if obj.type.name == "GameObject":
-                        data = obj.read()
-                        if data.name == "Worshipper Data":
-                            for component in data.m_Components:
-                                if component.type == 114:   # <ClassIDType.MonoBehaviour: 114>
-                                    worshipper_data = component.get_raw_data()
-                                    raise Done
-
-    except Done:
-        print("Found Worshipper Data")
-        with open("/Users/mark/dev/cotlgif/cotl/Worshipper Data.dat", "wb") as f:
-            f.write(worshipper_data)
-
-
-w = WorshipperData("/Users/mark/dev/cotlgif/cotl/Worshipper Data.dat")
-
-unk = []
-for i in range(11):
-    unk.append(w.read_u32())
-
-initial_sets = []
-set_count = w.read_u32()
-for s in range(set_count):
-    initial_sets.append(w.read_set())
-last = w.read_u32()
-
-skins = []
-while True:
-    if w.at_eof():
-        break
-    skins.append(w.read_skin())
-
-print("Writing worshipper_data.json")
-
-with open("worshipper_data.json", "w") as data:
-    json.dump({
+        futures = {executor.submit(find_worshipper_data, path): i for i, path in enumerate(paths)}
+        for future in as_completed(futures):
+            i = futures[future]
+            if found_index is not None and i > found_index:
+                continue
+
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"!!! Failed to read {paths[i]}: {e!r}")
+                errors.append(e)
+                continue
+
+            if result is not None:
+                found_index = i
+                worshipper_data = result
+                for other, j in futures.items():
+                    if j > i:
+                        other.cancel()
+
+            if found_index is not None and all(other.done() for other, j in futures.items() if j < found_index):
+                break
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    if worshipper_data is None and errors:
+        raise errors[0]
+
+    return worshipper_data
+
+
+if __name__ == "__main__":
+    if 1:
+        PATH = "/Users/mark/Library/Application Support/Steam/steamapps/common/Cult of the Lamb/Cult Of The Lamb.app/Contents/Resources/Data"
+
+        print("Finding Worshipper Data")
+        worshipper_data = scan_for_worshipper_data(PATH)
+
+        if worshipper_data is not None:
+            print("Found Worshipper Data")
+            with open("/Users/mark/dev/cotlgif/cotl/Worshipper Data.dat", "wb") as f:
+                f.write(worshipper_data)
+
+    initial_sets, skins = read_file("/Users/mark/dev/cotlgif/cotl/Worshipper Data.dat")
+
+    print("Writing worshipper_data.json")
+
+    output = {
         "global": initial_sets,
         "skins": skins
-    }, data)
+    }
+
+    if orjson is not None:
+        with open("worshipper_data.json", "wb") as data:
+            data.write(orjson.dumps(output))
+    else:
+        with open("worshipper_data.json", "w", encoding="utf-8") as data:
+            json.dump(output, data, separators=(",", ":"), ensure_ascii=False)